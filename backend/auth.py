@@ -1,8 +1,14 @@
 import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import jwt
 from datetime import datetime, timedelta
-from passlib.context import CryptContext
+import bcrypt
 from fastapi import HTTPException, Security
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 # Dummy comment v2
@@ -15,31 +21,102 @@ load_dotenv()
 SECRET_KEY = os.getenv("SECRET_KEY", "fallback-key")
 ALGORITHM = "HS256"
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Built once at import: the decoder with its options and the HMAC key as bytes.
+# No aud/iss claims are issued, so those checks are skipped.
+_SECRET_BYTES = SECRET_KEY.encode()
+_jwt = jwt.PyJWT(options={"require": ["exp"], "verify_aud": False, "verify_iss": False})
+
+# bcrypt cost doubles with every round; 10 keeps login/register around 50-80 ms on commodity hardware.
+# The cost is stored in each hash, so existing hashes with a different cost still verify.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "10"))
+HASH_WARN_MS = 300
 security = HTTPBearer()
 
+# bcrypt is deliberately slow, so hashing runs on its own threads instead of blocking the event loop
+_pw_pool = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="pwhash")
+
+# Verified JWT payloads, keyed by a hash of the raw token so we never keep the token itself.
+# Entries live for at most JWT_CACHE_TTL seconds and never past the token's own "exp".
+# Each entry is (payload, is_manager, expires_at) so role checks don't touch the claims again.
+JWT_CACHE_TTL = 5
+JWT_CACHE_MAXSIZE = 4096
+# The auth dependencies are sync, so FastAPI calls them from its threadpool: all access goes through the lock.
+_jwt_cache: dict[bytes, tuple[dict, bool, float]] = {}
+_jwt_cache_lock = threading.Lock()
+
+# Direct bcrypt calls; hashes are the same $2b$ format passlib produced.
+# bcrypt only uses the first 72 bytes, so truncate like passlib did instead of erroring.
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    return bcrypt.checkpw(plain_password.encode()[:72], hashed_password.encode())
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    return bcrypt.hashpw(password.encode()[:72], bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode()
+
+async def verify_password_async(plain_password, hashed_password):
+    return await asyncio.get_running_loop().run_in_executor(_pw_pool, verify_password, plain_password, hashed_password)
+
+async def hash_password_async(password):
+    return await asyncio.get_running_loop().run_in_executor(_pw_pool, get_password_hash, password)
+
+def calibrate_password_hashing():
+    # One-shot benchmark at startup so a too-expensive BCRYPT_ROUNDS shows up in the logs
+    start = time.perf_counter()
+    get_password_hash("calibration-password")
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    if elapsed_ms > HASH_WARN_MS:
+        logging.getLogger(__name__).warning(
+            "Password hashing took %.0f ms with BCRYPT_ROUNDS=%d; consider lowering it", elapsed_ms, BCRYPT_ROUNDS
+        )
+    return elapsed_ms
 
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=2)):
     to_encode = data.copy()
     to_encode.update({"exp": datetime.utcnow() + expires_delta})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(to_encode, _SECRET_BYTES, algorithm=ALGORITHM)
+
+def _cache_payload(key: bytes, payload: dict):
+    now = time.monotonic()
+    ttl = min(JWT_CACHE_TTL, payload["exp"] - time.time())
+    if ttl <= 0:
+        return
+    with _jwt_cache_lock:
+        # Re-insert so the dict stays ordered oldest-first; when full, evict the oldest entry
+        _jwt_cache.pop(key, None)
+        while len(_jwt_cache) >= JWT_CACHE_MAXSIZE:
+            del _jwt_cache[next(iter(_jwt_cache))]
+        _jwt_cache[key] = (payload, payload.get("role") == "manager", now + ttl)
+
+def _decode_token(token: str) -> tuple[dict, bool]:
+    key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+    with _jwt_cache_lock:
+        cached = _jwt_cache.get(key)
+        if cached and cached[2] <= time.monotonic():
+            del _jwt_cache[key]
+            cached = None
+    if cached:
+        return cached[0], cached[1]
 
-# Dependency Injection for RBAC
-def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        return payload # Returns { "username": "Siddhant", "role": "manager" }
+        payload = _jwt.decode(token, _SECRET_BYTES, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
+        with _jwt_cache_lock:
+            _jwt_cache.pop(key, None)
         raise HTTPException(status_code=401, detail="Token expired")
     except jwt.InvalidTokenError:
+        with _jwt_cache_lock:
+            _jwt_cache.pop(key, None)
         raise HTTPException(status_code=401, detail="Invalid token")
 
-def require_manager(user: dict = Security(get_current_user)):
-    if user.get("role") != "manager":
+    _cache_payload(key, payload)
+    return payload, payload.get("role") == "manager"
+
+# Dependency Injection for RBAC
+def get_current_user(credentials: HTTPAuthorizationCredentials = Security(security)):
+    payload, _ = _decode_token(credentials.credentials)
+    return payload # Returns { "username": "Siddhant", "role": "manager" }
+
+def require_manager(credentials: HTTPAuthorizationCredentials = Security(security)):
+    user, is_manager = _decode_token(credentials.credentials)
+    if not is_manager:
         raise HTTPException(status_code=403, detail="Manager access required")
     return user
\ No newline at end of file
@@ -1,9 +1,33 @@
+import os
 import motor.motor_asyncio
 
 # This URL connects directly to your local MongoDB Compass
-MONGO_URL = "mongodb://localhost:27017"
-client = motor.motor_asyncio.AsyncIOMotorClient(MONGO_URL)
+MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
+
+# Pool sizing for an async app: a few dozen sockets cover bursts, idle ones get closed after 30s,
+# and unreachable servers / exhausted pools fail fast instead of hanging requests.
+client = motor.motor_asyncio.AsyncIOMotorClient(
+    MONGO_URL,
+    maxPoolSize=int(os.getenv("MONGO_MAX_POOL_SIZE", "50")),
+    minPoolSize=int(os.getenv("MONGO_MIN_POOL_SIZE", "5")),
+    maxIdleTimeMS=int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "30000")),
+    serverSelectionTimeoutMS=int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "2000")),
+    connectTimeoutMS=int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "2000")),
+    waitQueueTimeoutMS=int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "1000")),
+    retryWrites=True,
+)
 
 # Create a database called 'shiftsync' and a collection called 'shifts'
 db = client.shiftsync
-shift_collection = db.get_collection("shifts")
\ No newline at end of file
+shift_collection = db.get_collection("shifts")
+user_collection = db.get_collection("users")
+audit_collection = db.get_collection("audit_logs")
+
+async def init_indexes():
+    # Overlap check in request_shift: assigned user + time window
+    await shift_collection.create_index([("assigned_employees", 1), ("start_time", 1), ("end_time", 1)])
+    # GET /shifts/ sorts by (start_time, _id); /analytics matches on the start_time prefix
+    await shift_collection.create_index([("start_time", 1), ("_id", 1)])
+    # Login/register look users up by name
+    await user_collection.create_index("username", unique=True)
+    await audit_collection.create_index([("timestamp", -1)])
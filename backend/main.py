@@ -1,15 +1,21 @@
-import json
-from fastapi import FastAPI, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Depends
+import time
+import asyncio
+import logging
+import orjson
+from fastapi import FastAPI, Query, HTTPException, BackgroundTasks, WebSocket, WebSocketDisconnect, Depends
 from fastapi.middleware.cors import CORSMiddleware
-from passlib.context import CryptContext
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from models import ShiftSchema, UserCreate, Token, ShiftUpdate, ApprovalAction
-from database import db, shift_collection
+from database import shift_collection, user_collection, audit_collection, init_indexes
 from bson import ObjectId
-from auth import require_manager, get_current_user, create_access_token, verify_password, get_password_hash
+from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from auth import require_manager, get_current_user, create_access_token, verify_password_async, hash_password_async, calibrate_password_hashing
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import datetime, timedelta
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,32 +25,99 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-user_collection = db.get_collection("users")
-
 # --- WEBSOCKET MANAGER (Upgraded to handle JSON) ---
+# Each client gets its own bounded outbox drained by a sender task, so a broadcast is just an
+# enqueue per client and a slow consumer can't hold up the handler that triggered it
+SEND_QUEUE_SIZE = 128
+
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: list[WebSocket] = []
+        self.active_connections: dict[WebSocket, asyncio.Queue] = {}
+        self._senders: dict[WebSocket, asyncio.Task] = {}
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.active_connections[websocket] = queue
+        self._senders[websocket] = asyncio.create_task(self._sender(websocket, queue))
+
+    def disconnect(self, websocket: WebSocket):
+        self.active_connections.pop(websocket, None)
+        sender = self._senders.pop(websocket, None)
+        if sender and sender is not asyncio.current_task():
+            sender.cancel()
+
+    async def _sender(self, websocket: WebSocket, queue: asyncio.Queue):
+        try:
+            while True:
+                message = await queue.get()
+                await websocket.send_text(message)
+        except asyncio.CancelledError:
+            # Dropped for falling behind (or the client already left): make sure the socket is closed
+            try:
+                await websocket.close(code=1013)
+            except Exception:
+                pass
+            raise
+        except Exception:
+            self.disconnect(websocket)
 
     async def broadcast_json(self, data: dict):
-        for connection in self.active_connections:
-            # FIX: default=str prevents crashes when sending datetime objects!
-            await connection.send_text(json.dumps(data, default=str))
+        # Encode once for all clients; orjson handles datetimes natively, default=str covers ObjectId
+        message = orjson.dumps(data, default=str).decode()
+        for connection, queue in list(self.active_connections.items()):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Too far behind to catch up; the dashboard reconnects with backoff and refetches /shifts/
+                self.disconnect(connection)
 
 manager = ConnectionManager()
 
+# Path dependency: parse the shift id once per request and turn malformed ids into a 400 instead of a 500
+def parse_shift_id(shift_id: str) -> ObjectId:
+    try:
+        return ObjectId(shift_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid shift id")
+
+# Only the fields ShiftSchema actually serializes
+SHIFT_PROJECTION = {
+    "title": 1,
+    "start_time": 1,
+    "end_time": 1,
+    "assigned_employees": 1,
+    "pending_employees": 1,
+    "drop_requests": 1,
+}
+
+@app.on_event("startup")
+async def startup():
+    global audit_queue, audit_writer_task
+    await init_indexes()
+    calibrate_password_hashing()
+    audit_queue = asyncio.Queue()
+    audit_writer_task = asyncio.create_task(audit_writer())
+
+@app.on_event("shutdown")
+async def shutdown():
+    # The sentinel lands behind every queued entry, so the writer flushes them all before exiting
+    audit_queue.put_nowait(_AUDIT_STOP)
+    await audit_writer_task
+    # Anything logged after the sentinel
+    pending = []
+    while not audit_queue.empty():
+        pending.append(audit_queue.get_nowait())
+    await _write_audit_batch(pending)
+
 
 
 
 
 @app.put("/shifts/{shift_id}", response_model=ShiftSchema)
-async def update_shift(shift_id: str, shift_data: ShiftUpdate, user: dict = Depends(require_manager)):
+async def update_shift(shift_id: str, shift_data: ShiftUpdate, oid: ObjectId = Depends(parse_shift_id), user: dict = Depends(require_manager)):
     updated_shift = await shift_collection.find_one_and_update(
-        {"_id": ObjectId(shift_id)},
+        {"_id": oid},
         {"$set": {
             "title": shift_data.title,
             "start_time": shift_data.start_time,
@@ -66,7 +139,7 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
-        manager.active_connections.remove(websocket)
+        manager.disconnect(websocket)
 
 # --- REAL AUTHENTICATION ROUTES ---
 @app.post("/register")
@@ -75,16 +148,20 @@ async def register_user(user: UserCreate):
     if existing_user:
         raise HTTPException(status_code=400, detail="Username already taken")
     
-    hashed_password = get_password_hash(user.password)
+    hashed_password = await hash_password_async(user.password)
     new_user = {"username": user.username, "password": hashed_password, "role": user.role}
-    await user_collection.insert_one(new_user)
+    try:
+        await user_collection.insert_one(new_user)
+    except DuplicateKeyError:
+        # Two registrations for the same name raced past the find_one above
+        raise HTTPException(status_code=400, detail="Username already taken")
     return {"message": "User registered successfully"}
 
 @app.post("/login", response_model=Token)
 async def login(user: dict):
     # Expecting {"username": "...", "password": "..."} from React
     db_user = await user_collection.find_one({"username": user.get("username")})
-    if not db_user or not verify_password(user.get("password"), db_user["password"]):
+    if not db_user or not await verify_password_async(user.get("password"), db_user["password"]):
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
     token = create_access_token(data={"username": db_user["username"], "role": db_user["role"]})
@@ -103,41 +180,84 @@ async def create_shift(shift: ShiftSchema, user: dict = Depends(require_manager)
     await manager.broadcast_json({"action": "NEW_SHIFT", "shift": created_shift})
     return created_shift
 
-@app.get("/shifts/", response_model=list[ShiftSchema])
-async def get_shifts():
-    shifts = await shift_collection.find().to_list(100)
-    for shift in shifts:
+@app.get("/shifts/")
+async def get_shifts(limit: int = Query(100, ge=1, le=1000), skip: int = Query(0, ge=0)):
+    # Stream the JSON array straight off the cursor instead of building the whole list first
+    # _id breaks start_time ties so skip/limit pages are stable
+    cursor = shift_collection.find({}, projection=SHIFT_PROJECTION).sort([("start_time", 1), ("_id", 1)]).skip(skip).limit(limit)
+
+    # Pull the first document before committing to a 200, so Mongo errors (e.g. server selection
+    # timeouts) still surface as a proper error response instead of a truncated body
+    try:
+        first_shift = await cursor.next()
+    except StopAsyncIteration:
+        first_shift = None
+
+    def encode(shift: dict) -> bytes:
         shift["_id"] = str(shift["_id"])
-    return shifts
+        # Same defaults ShiftSchema would have filled in
+        for field in ("assigned_employees", "pending_employees", "drop_requests"):
+            shift.setdefault(field, [])
+        return orjson.dumps(shift)
+
+    async def iter_shifts():
+        yield b"["
+        if first_shift is not None:
+            yield encode(first_shift)
+            async for shift in cursor:
+                yield b"," + encode(shift)
+        yield b"]"
+
+    return StreamingResponse(iter_shifts(), media_type="application/json")
 
 # --- 1. THE REQUEST SHIFT ROUTE (With Overlap Prevention) ---
 @app.put("/shifts/{shift_id}/request", response_model=ShiftSchema)
-async def request_shift(shift_id: str, bg_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
-    # Fetch the target shift to get its start and end times
-    target_shift = await shift_collection.find_one({"_id": ObjectId(shift_id)})
+async def request_shift(shift_id: str, bg_tasks: BackgroundTasks, oid: ObjectId = Depends(parse_shift_id), user: dict = Depends(get_current_user)):
+    # ALGORITHM: Time Overlap Prevention
+    # One round-trip: fetch the target shift and self-join any shift the user is already
+    # assigned to that overlaps with its time window
+    pipeline = [
+        {"$match": {"_id": oid}},
+        {"$lookup": {
+            "from": shift_collection.name,
+            "let": {"start": "$start_time", "end": "$end_time"},
+            "pipeline": [
+                # Trade-off: $expr range comparisons can't use the multikey (assigned_employees,
+                # start_time, end_time) index, so only the assigned_employees equality is
+                # index-bounded and that user's assigned shifts are then filtered by time. That set
+                # is small per employee and this saves a round-trip over a separate window fetch.
+                {"$match": {
+                    "assigned_employees": user["username"],
+                    "$expr": {"$and": [
+                        {"$lt": ["$start_time", "$$end"]},
+                        {"$gt": ["$end_time", "$$start"]}
+                    ]}
+                }},
+                {"$limit": 1},
+                {"$project": {"_id": 1}}  # Only existence matters here
+            ],
+            "as": "conflicts"
+        }},
+        {"$project": {"conflicts": 1}}
+    ]
+    target_shift = await shift_collection.aggregate(pipeline).to_list(1)
     if not target_shift:
         raise HTTPException(status_code=404, detail="Shift not found")
 
-    # ALGORITHM: Time Overlap Prevention
-    # Check if the user is already assigned to ANY shift that overlaps with this new one
-    overlapping_shift = await shift_collection.find_one({
-        "assigned_employees": user["username"],
-        "$and": [
-            {"start_time": {"$lt": target_shift["end_time"]}},
-            {"end_time": {"$gt": target_shift["start_time"]}}
-        ]
-    })
-    
-    if overlapping_shift:
+    if target_shift[0]["conflicts"]:
         raise HTTPException(status_code=400, detail="Schedule conflict! You are already working during this time.")
 
-    # Move user to the pending queue
+    # Move user to the pending queue. This check is only advisory: a pending claim assigns nothing,
+    # and the authoritative overlap check runs again when a manager approves it.
     updated_shift = await shift_collection.find_one_and_update(
-        {"_id": ObjectId(shift_id)},
+        {"_id": oid},
         {"$addToSet": {"pending_employees": user["username"]}},
+        projection=SHIFT_PROJECTION,
         return_document=True
     )
-    
+    if not updated_shift:
+        raise HTTPException(status_code=404, detail="Shift not found")
+
     updated_shift["_id"] = str(updated_shift["_id"])
     
     # Trigger Background Audit Log & WebSocket Update
@@ -147,22 +267,52 @@ async def request_shift(shift_id: str, bg_tasks: BackgroundTasks, user: dict = D
 
 
 # --- 2. MANAGER APPROVAL ROUTE ---
+# Approval is where an employee actually gets assigned, so overlap is enforced here.
+# Plain range predicates, so the (assigned_employees, start_time, end_time) index bounds the whole scan.
+async def has_schedule_conflict(username: str, target_shift: dict) -> bool:
+    return await shift_collection.find_one({
+        "_id": {"$ne": target_shift["_id"]},
+        "assigned_employees": username,
+        "start_time": {"$lt": target_shift["end_time"]},
+        "end_time": {"$gt": target_shift["start_time"]}
+    }, {"_id": 1}) is not None
+
+async def get_approval_target(oid: ObjectId, employees: list[str]) -> dict:
+    target_shift = await shift_collection.find_one({"_id": oid}, {"start_time": 1, "end_time": 1})
+    if not target_shift:
+        raise HTTPException(status_code=404, detail="Shift not found")
+
+    conflicts = await asyncio.gather(*(has_schedule_conflict(name, target_shift) for name in employees))
+    conflicting = [name for name, conflict in zip(employees, conflicts) if conflict]
+    if conflicting:
+        raise HTTPException(status_code=400, detail=f"Schedule conflict! Already working during this time: {', '.join(conflicting)}")
+    return target_shift
+
+def approval_filter(target_shift: dict) -> dict:
+    # Only write if the window we checked against is still the shift's window
+    return {"_id": target_shift["_id"], "start_time": target_shift["start_time"], "end_time": target_shift["end_time"]}
+
 @app.put("/shifts/{shift_id}/review", response_model=ShiftSchema)
-async def review_shift_request(shift_id: str, payload: ApprovalAction, bg_tasks: BackgroundTasks, user: dict = Depends(require_manager)):
+async def review_shift_request(shift_id: str, payload: ApprovalAction, bg_tasks: BackgroundTasks, oid: ObjectId = Depends(parse_shift_id), user: dict = Depends(require_manager)):
     # Remove from pending queue
     update_query = {"$pull": {"pending_employees": payload.employee_name}}
     
+    shift_filter = {"_id": oid}
     # If approved, also add to assigned array
     if payload.action == "approve":
+        target_shift = await get_approval_target(oid, [payload.employee_name])
+        shift_filter = approval_filter(target_shift)
         update_query["$addToSet"] = {"assigned_employees": payload.employee_name} # type: ignore
 
     updated_shift = await shift_collection.find_one_and_update(
-        {"_id": ObjectId(shift_id)},
+        shift_filter,
         update_query,
         return_document=True
     )
     
     if not updated_shift:
+        if payload.action == "approve":
+            raise HTTPException(status_code=409, detail="Shift was changed or removed, please retry")
         raise HTTPException(status_code=404, detail="Shift not found")
 
     updated_shift["_id"] = str(updated_shift["_id"])
@@ -174,45 +324,81 @@ async def review_shift_request(shift_id: str, payload: ApprovalAction, bg_tasks:
     return updated_shift
 
 
+# Review several pending claims on one shift ("approve all") in a single round-trip and broadcast
+@app.post("/shifts/{shift_id}/review-batch", response_model=ShiftSchema)
+async def review_shift_requests(shift_id: str, payload: list[ApprovalAction], bg_tasks: BackgroundTasks, oid: ObjectId = Depends(parse_shift_id), user: dict = Depends(require_manager)):
+    if not payload:
+        raise HTTPException(status_code=400, detail="No review actions given")
+
+    approved = [review.employee_name for review in payload if review.action == "approve"]
+    shift_filter = {"_id": oid}
+    if approved:
+        shift_filter = approval_filter(await get_approval_target(oid, approved))
+
+    ops = []
+    for review in payload:
+        update_query = {"$pull": {"pending_employees": review.employee_name}}
+        if review.action == "approve":
+            update_query["$addToSet"] = {"assigned_employees": review.employee_name} # type: ignore
+        ops.append(UpdateOne(shift_filter, update_query))
+
+    result = await shift_collection.bulk_write(ops, ordered=False)
+    if not result.matched_count:
+        if approved:
+            raise HTTPException(status_code=409, detail="Shift was changed or removed, please retry")
+        raise HTTPException(status_code=404, detail="Shift not found")
+
+    updated_shift = await shift_collection.find_one({"_id": oid}, SHIFT_PROJECTION)
+    if not updated_shift:
+        raise HTTPException(status_code=404, detail="Shift not found")
+
+    updated_shift["_id"] = str(updated_shift["_id"])
+
+    for review in payload:
+        log_msg = f"{'Approved' if review.action == 'approve' else 'Denied'} {review.employee_name}"
+        bg_tasks.add_task(log_audit_action, log_msg, user["username"], shift_id)
+    await manager.broadcast_json({"action": "UPDATE_SHIFT", "shift": updated_shift})
+
+    return updated_shift
+
+
 # --- 3. THE DROP SHIFT ROUTE ---
 
-@app.put("/shifts/{shift_id}/drop", response_model=ShiftSchema)
-async def drop_shift(shift_id: str, bg_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
-    updated_shift = await shift_collection.find_one_and_update(
-        {"_id": ObjectId(shift_id)},
+@app.put("/shifts/{shift_id}/drop")
+async def drop_shift(shift_id: str, bg_tasks: BackgroundTasks, oid: ObjectId = Depends(parse_shift_id), user: dict = Depends(get_current_user)):
+    # A single $pull is atomic and scans each array once, removing the user wherever they are
+    result = await shift_collection.update_one(
+        {"_id": oid},
         {"$pull": {
             "assigned_employees": user["username"],
             "pending_employees": user["username"],
             "drop_requests": user["username"]
-        }},
-        return_document=True
+        }}
     )
-    
-    if updated_shift:
-        updated_shift["_id"] = str(updated_shift["_id"])
-        bg_tasks.add_task(log_audit_action, "Cancelled Request/Dropped", user["username"], shift_id)
-        await manager.broadcast_json({"action": "UPDATE_SHIFT", "shift": updated_shift})
-        return updated_shift
-        
-    raise HTTPException(status_code=404, detail="Shift not found")
-@app.put("/shifts/{shift_id}/request-drop", response_model=ShiftSchema)
-async def request_drop(shift_id: str, bg_tasks: BackgroundTasks, user: dict = Depends(get_current_user)):
+    if not result.matched_count:
+        raise HTTPException(status_code=404, detail="Shift not found")
+
+    # We know the exact delta, so skip fetching the full post-image and broadcast a diff instead
+    bg_tasks.add_task(log_audit_action, "Cancelled Request/Dropped", user["username"], shift_id)
+    await manager.broadcast_json({"action": "UPDATE_SHIFT", "shift_id": shift_id, "op": "drop", "user": user["username"]})
+    return {"message": "Shift dropped successfully"}
+
+@app.put("/shifts/{shift_id}/request-drop")
+async def request_drop(shift_id: str, bg_tasks: BackgroundTasks, oid: ObjectId = Depends(parse_shift_id), user: dict = Depends(get_current_user)):
     # Add user to the drop_requests queue
-    updated_shift = await shift_collection.find_one_and_update(
-        {"_id": ObjectId(shift_id)},
-        {"$addToSet": {"drop_requests": user["username"]}},
-        return_document=True
+    result = await shift_collection.update_one(
+        {"_id": oid},
+        {"$addToSet": {"drop_requests": user["username"]}}
     )
-    if updated_shift:
-        updated_shift["_id"] = str(updated_shift["_id"])
+    if result.matched_count:
         bg_tasks.add_task(log_audit_action, "Requested to Drop Shift", user["username"], shift_id)
-        await manager.broadcast_json({"action": "UPDATE_SHIFT", "shift": updated_shift})
-        return updated_shift
+        await manager.broadcast_json({"action": "UPDATE_SHIFT", "shift_id": shift_id, "op": "request_drop", "user": user["username"]})
+        return {"message": "Drop request sent"}
     raise HTTPException(status_code=404, detail="Shift not found")
 
 
 @app.put("/shifts/{shift_id}/review-drop", response_model=ShiftSchema)
-async def review_drop_request(shift_id: str, payload: ApprovalAction, bg_tasks: BackgroundTasks, user: dict = Depends(require_manager)):
+async def review_drop_request(shift_id: str, payload: ApprovalAction, bg_tasks: BackgroundTasks, oid: ObjectId = Depends(parse_shift_id), user: dict = Depends(require_manager)):
     # Always remove from the drop queue
     update_query = {"$pull": {"drop_requests": payload.employee_name}}
     
@@ -221,7 +407,7 @@ async def review_drop_request(shift_id: str, payload: ApprovalAction, bg_tasks:
         update_query["$pull"]["assigned_employees"] = payload.employee_name # type: ignore
 
     updated_shift = await shift_collection.find_one_and_update(
-        {"_id": ObjectId(shift_id)},
+        {"_id": oid},
         update_query,
         return_document=True
     )
@@ -233,8 +419,8 @@ async def review_drop_request(shift_id: str, payload: ApprovalAction, bg_tasks:
     return updated_shift
 
 @app.delete("/shifts/{shift_id}")
-async def delete_shift(shift_id: str, bg_tasks: BackgroundTasks, user: dict = Depends(require_manager)):
-    result = await shift_collection.delete_one({"_id": ObjectId(shift_id)})
+async def delete_shift(shift_id: str, bg_tasks: BackgroundTasks, oid: ObjectId = Depends(parse_shift_id), user: dict = Depends(require_manager)):
+    result = await shift_collection.delete_one({"_id": oid})
     if result.deleted_count == 1:
         bg_tasks.add_task(log_audit_action, "Deleted Shift", user["username"], shift_id)
         # Tell all React clients to remove this specific ID from their state
@@ -242,9 +428,21 @@ async def delete_shift(shift_id: str, bg_tasks: BackgroundTasks, user: dict = De
         return {"message": "Shift deleted successfully"}
     raise HTTPException(status_code=404, detail="Shift not found")
 
+# Managers hit /analytics on every dashboard refresh; results are reused for a minute per window
+ANALYTICS_CACHE_TTL = 60
+_analytics_cache: dict[int, tuple[list, float]] = {}
+
 @app.get("/analytics")
-async def get_analytics(user: dict = Depends(require_manager)):
+async def get_analytics(days: int = Query(30, ge=1, le=365), user: dict = Depends(require_manager)):
+    cached = _analytics_cache.get(days)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    since = datetime.utcnow() - timedelta(days=days)
     pipeline = [
+        # 0. Only look at shifts in the window (served by the start_time index)
+        {"$match": {"start_time": {"$gte": since}}},
+
         # 1. Deconstruct the array so we can count per employee
         {"$unwind": "$assigned_employees"},
         
@@ -269,9 +467,49 @@ async def get_analytics(user: dict = Depends(require_manager)):
         {"$sort": {"total_hours": -1}}
     ]
     
-    return await shift_collection.aggregate(pipeline).to_list(100)
-
-audit_collection = db.get_collection("audit_logs")
+    # One document per employee, so the result stays small
+    results = await shift_collection.aggregate(pipeline, allowDiskUse=False).to_list(None)
+    _analytics_cache[days] = (results, time.monotonic() + ANALYTICS_CACHE_TTL)
+    return results
+
+# Audit entries are queued per request and written in batches by a single writer task
+AUDIT_BATCH_SIZE = 100
+AUDIT_FLUSH_INTERVAL = 0.05  # seconds
+audit_queue: asyncio.Queue
+audit_writer_task: asyncio.Task
+_AUDIT_STOP = None  # Queued at shutdown to stop the writer
+
+async def _write_audit_batch(batch: list[dict]):
+    if not batch:
+        return
+    try:
+        await audit_collection.insert_many(batch, ordered=False)
+    except Exception:
+        # Never let a bad batch kill the writer, or the queue would grow forever
+        logging.getLogger(__name__).exception("Failed to write %d audit log entries", len(batch))
+
+async def audit_writer():
+    loop = asyncio.get_running_loop()
+    stopping = False
+    while not stopping:
+        entry = await audit_queue.get()
+        if entry is _AUDIT_STOP:
+            break
+        batch = [entry]
+        deadline = loop.time() + AUDIT_FLUSH_INTERVAL
+        while len(batch) < AUDIT_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                entry = await asyncio.wait_for(audit_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if entry is _AUDIT_STOP:
+                stopping = True
+                break
+            batch.append(entry)
+        await _write_audit_batch(batch)
 
 # The asynchronous background task
 async def log_audit_action(action: str, username: str, shift_id: str):
@@ -281,4 +519,4 @@ async def log_audit_action(action: str, username: str, shift_id: str):
         "target_shift_id": str(shift_id),
         "timestamp": datetime.utcnow()
     }
-    await audit_collection.insert_one(log_entry)
\ No newline at end of file
+    audit_queue.put_nowait(log_entry)
\ No newline at end of file
@@ -7,6 +7,22 @@ import { Calendar, Clock, Users, Plus, BarChart, LogOut, Edit2, X, Trash2 } from
 import toast, { Toaster } from 'react-hot-toast';
 import type { Shift } from '../types';
 
+const applyShiftDiff = (shift: Shift, op: string, user: string): Shift => {
+    const without = (list?: string[]) => (list || []).filter(name => name !== user);
+    if (op === 'drop') {
+        return {
+            ...shift,
+            assigned_employees: without(shift.assigned_employees),
+            pending_employees: without(shift.pending_employees),
+            drop_requests: without(shift.drop_requests),
+        };
+    }
+    if (op === 'request_drop') {
+        return { ...shift, drop_requests: [...without(shift.drop_requests), user] };
+    }
+    return shift;
+};
+
 export default function Dashboard() {
     const [shifts, setShifts] = useState<Shift[]>([]);
 
@@ -27,35 +43,59 @@ export default function Dashboard() {
             return;
         }
 
-        // Initial data fetch
-        axios.get('http://localhost:8000/shifts/').then(res => setShifts(res.data));
-
-        // Robust WebSocket Connection
-        const ws = new WebSocket('ws://localhost:8000/ws');
+        const fetchShifts = () => axios.get('http://localhost:8000/shifts/').then(res => setShifts(res.data));
 
-        ws.onopen = () => {
-            console.log("🟢 WebSocket Connected Successfully!");
-        };
-
-        ws.onmessage = (event) => {
-            const payload = JSON.parse(event.data);
-            if (payload.action === "NEW_SHIFT") {
-                setShifts(prev => [...prev, payload.shift]);
-                if (role !== 'manager') toast('New shift published!', { icon: '📢' });
-            } else if (payload.action === "UPDATE_SHIFT") {
-                setShifts(prev => prev.map(s => s._id === payload.shift._id ? payload.shift : s));
-            } else if (payload.action === "DELETE_SHIFT") {
-                // Instantly filter out the deleted shift
-                setShifts(prev => prev.filter(s => s._id !== payload.shift_id));
-                toast.error("A shift was removed by a manager");
-            }
+        // Initial data fetch
+        fetchShifts();
+
+        // Robust WebSocket Connection: the server closes clients that fall too far behind,
+        // so reconnect with exponential backoff and refetch whatever was missed
+        let ws: WebSocket;
+        let retryDelay = 1000;
+        let reconnectTimer: ReturnType<typeof setTimeout> | undefined;
+        let hasConnected = false;
+        let unmounted = false;
+
+        const connect = () => {
+            ws = new WebSocket('ws://localhost:8000/ws');
+
+            ws.onopen = () => {
+                console.log("🟢 WebSocket Connected Successfully!");
+                retryDelay = 1000;
+                if (hasConnected) fetchShifts();
+                hasConnected = true;
+            };
+
+            ws.onmessage = (event) => {
+                const payload = JSON.parse(event.data);
+                if (payload.action === "NEW_SHIFT") {
+                    setShifts(prev => [...prev, payload.shift]);
+                    if (role !== 'manager') toast('New shift published!', { icon: '📢' });
+                } else if (payload.action === "UPDATE_SHIFT" && payload.op) {
+                    // Compact diff: apply the change locally instead of receiving the whole shift
+                    setShifts(prev => prev.map(s => s._id === payload.shift_id ? applyShiftDiff(s, payload.op, payload.user) : s));
+                } else if (payload.action === "UPDATE_SHIFT") {
+                    setShifts(prev => prev.map(s => s._id === payload.shift._id ? payload.shift : s));
+                } else if (payload.action === "DELETE_SHIFT") {
+                    // Instantly filter out the deleted shift
+                    setShifts(prev => prev.filter(s => s._id !== payload.shift_id));
+                    toast.error("A shift was removed by a manager");
+                }
+            };
+
+            ws.onclose = () => {
+                console.log("🔴 WebSocket Disconnected.");
+                if (unmounted) return;
+                reconnectTimer = setTimeout(connect, retryDelay);
+                retryDelay = Math.min(retryDelay * 2, 30000);
+            };
         };
 
-        ws.onclose = () => {
-            console.log("🔴 WebSocket Disconnected.");
-        };
+        connect();
 
         return () => {
+            unmounted = true;
+            clearTimeout(reconnectTimer);
             ws.close();
         };
     }, [token, navigate, role]);
@@ -146,6 +186,16 @@ export default function Dashboard() {
         } catch (err) { toast.error("Error processing review"); }
     };
 
+    // Manager approves every pending claim on a shift in one request
+    const handleApproveAll = async (shiftId: string, employees: string[]) => {
+        try {
+            await axios.post(`http://localhost:8000/shifts/${shiftId}/review-batch`,
+                employees.map(emp => ({ employee_name: emp, action: 'approve' })),
+                { headers: { Authorization: `Bearer ${token}` } });
+            toast.success(`Approved ${employees.length} claim requests`);
+        } catch (err) { toast.error("Error processing review"); }
+    };
+
     // Manager reviews a drop request
     const handleReviewDrop = async (shiftId: string, employeeName: string, action: 'approve' | 'deny') => {
         try {
@@ -257,7 +307,12 @@ export default function Dashboard() {
                                     {/* Manager View: Claim Requests Queue */}
                                     {role === 'manager' && shift.pending_employees && shift.pending_employees.length > 0 && (
                                         <div className="mb-4 p-3 bg-amber-50 rounded-xl border border-amber-100">
-                                            <p className="text-xs font-bold text-amber-800 uppercase mb-2">Pending Claim Approvals</p>
+                                            <div className="flex justify-between items-center mb-2">
+                                                <p className="text-xs font-bold text-amber-800 uppercase">Pending Claim Approvals</p>
+                                                {shift.pending_employees.length > 1 && (
+                                                    <button onClick={() => handleApproveAll(shift._id!, shift.pending_employees!)} className="px-2 py-1 bg-green-100 text-green-700 rounded hover:bg-green-200 font-medium text-xs">Approve All</button>
+                                                )}
+                                            </div>
                                             {shift.pending_employees.map(emp => (
                                                 <div key={emp} className="flex justify-between items-center bg-white p-2 rounded-lg mb-2 shadow-sm border border-amber-100 text-sm">
                                                     <span className="font-medium text-slate-700">{emp}</span>
@@ -5,5 +5,6 @@ export interface Shift {
     start_time: string;
     end_time: string;
     assigned_employees: string[];
+    pending_employees?: string[];
     drop_requests?: string[];
 }
\ No newline at end of file